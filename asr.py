@@ -14,12 +14,44 @@ but optimized for real-time streaming applications.
 """
 
 import asyncio
+import logging
 import os
+import socket
 from cartesia import AsyncCartesia
 from components import ASRInterface
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Optional
 
 from conversation_manager import ConversationManager, PipelineState
+
+logger = logging.getLogger(__name__)
+
+# Local aliases for the states checked on every ASR result
+_RESPONDING = PipelineState.RESPONDING
+_PROCESSING = PipelineState.PROCESSING
+
+
+def _set_low_latency_socket_options(ws) -> None:
+    """
+    Make sure Nagle's algorithm is disabled on a Cartesia WebSocket.
+    
+    The ASR uplink sends many small audio frames; with Nagle enabled the kernel
+    may hold them back waiting for ACKs, adding tens of milliseconds per send.
+    aiohttp normally sets TCP_NODELAY itself; this guards against transports
+    that do not.
+    
+    Args:
+        ws: Connected Cartesia WebSocket wrapper (exposes the aiohttp connection as .websocket)
+    """
+    connection = getattr(ws, "websocket", None)
+    sock = connection.get_extra_info("socket") if connection is not None else None
+    if sock is None:
+        return
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except OSError as e:
+        print(f"[ASR] Could not set socket options: {e}")
+
+
 class CartesiaASR(ASRInterface):
     """
     Cartesia-powered Automatic Speech Recognition implementation.
@@ -34,19 +66,101 @@ class CartesiaASR(ASRInterface):
     - Word-level timing information
     - Optimized for Chinese language processing
     - WebSocket-based communication for low latency
+    - Pool of pre-established WebSocket sessions to skip the connect handshake
     """
     
     def __init__(self,
-                 conversation_manager: ConversationManager
+                 conversation_manager: ConversationManager,
+                 max_send_bytes: int = 8192,
+                 pool_size: int = 1,
+                 final_coalesce_secs: float = 0.05
                  ):
         """
         Initialize the Cartesia ASR client.
         
         Requires CARTESIA_API_KEY environment variable to be set.
+        
+        Args:
+            conversation_manager: Shared pipeline state manager
+            max_send_bytes: Upper bound on audio bytes coalesced into one WebSocket frame
+                (a single chunk larger than this is still sent whole, on its own)
+            pool_size: Number of idle WebSocket sessions kept warm for the next transcription
+            final_coalesce_secs: Window for merging back-to-back final transcripts into one utterance
         """
         self.conversation_manager = conversation_manager
+        self.max_send_bytes = max_send_bytes
+        self.pool_size = pool_size
+        self.final_coalesce_secs = final_coalesce_secs
         self.current_session_id=0
         self.client = AsyncCartesia(api_key=os.getenv("CARTESIA_API_KEY"))
+        
+        # Warm, idle WebSocket sessions and the task that refills them
+        self._ws_pool: asyncio.Queue = asyncio.Queue()
+        self._refill_task: Optional[asyncio.Task] = None
+
+    async def _open_websocket(self):
+        """
+        Open a new WebSocket session to Cartesia's ASR service.
+        
+        Returns:
+            Connected Cartesia STT WebSocket
+        """
+        ws = await self.client.stt.websocket(
+            model="ink-whisper",          # Cartesia's streaming Whisper model
+            language="zh",                # Chinese language optimization
+            encoding="pcm_s16le",         # 16-bit PCM little-endian format
+            sample_rate=16000,            # 16kHz sample rate
+            min_volume=0.15,              # Volume threshold for voice activity detection. Audio below this threshold will be considered silence. Range: 0.0-1.0.
+            max_silence_duration_secs=2.0, # Maximum duration of silence (in seconds) before the system considers the utterance complete and triggers endpointing. Higher values allow for longer pauses within utterances.
+
+        )
+        _set_low_latency_socket_options(ws)
+        return ws
+
+    async def prewarm(self):
+        """
+        Fill the pool with idle WebSocket sessions up to pool_size.
+        
+        Call ahead of time (e.g. at startup) so the next transcribe_stream()
+        starts sending audio without waiting for a TLS/WebSocket handshake.
+        """
+        while self._ws_pool.qsize() < self.pool_size:
+            try:
+                ws = await self._open_websocket()
+            except Exception as e:
+                print(f"[ASR] Failed to pre-establish WebSocket: {e}")
+                return
+            self._ws_pool.put_nowait(ws)
+
+    async def _acquire_websocket(self):
+        """
+        Take a warm WebSocket session from the pool, opening one if none is usable.
+        
+        Returns:
+            Connected Cartesia STT WebSocket
+        """
+        while not self._ws_pool.empty():
+            ws = self._ws_pool.get_nowait()
+            # Sessions idle for too long may have been closed by the server
+            if ws.websocket is not None and not ws.websocket.closed:
+                return ws
+            await ws.close()
+        return await self._open_websocket()
+
+    def _schedule_refill(self):
+        """Start replacing used sessions in the background, unless already doing so."""
+        if self.pool_size > 0 and (self._refill_task is None or self._refill_task.done()):
+            self._refill_task = asyncio.create_task(self.prewarm())
+
+    async def close(self):
+        """
+        Close pooled WebSocket sessions and the underlying Cartesia client.
+        """
+        if self._refill_task is not None:
+            self._refill_task.cancel()
+        while not self._ws_pool.empty():
+            await self._ws_pool.get_nowait().close()
+        await self.client.close()
 
     async def transcribe_stream(self, audio_queue: asyncio.Queue) -> AsyncGenerator[str, None]:
         """
@@ -57,21 +171,16 @@ class CartesiaASR(ASRInterface):
         with the Cartesia ASR service.
         
         Args:
-            audio_queue: Queue containing audio chunks (bytes) and END signal
+            audio_queue: Queue containing audio chunks (bytes); None marks end of stream
             
         Yields:
             str: Text transcriptions (final results only for pipeline efficiency)
         """
-        # Establish WebSocket connection to Cartesia ASR service
-        ws = await self.client.stt.websocket(
-            model="ink-whisper",          # Cartesia's streaming Whisper model
-            language="zh",                # Chinese language optimization
-            encoding="pcm_s16le",         # 16-bit PCM little-endian format
-            sample_rate=16000,            # 16kHz sample rate
-            min_volume=0.15,              # Volume threshold for voice activity detection. Audio below this threshold will be considered silence. Range: 0.0-1.0.
-            max_silence_duration_secs=2.0, # Maximum duration of silence (in seconds) before the system considers the utterance complete and triggers endpointing. Higher values allow for longer pauses within utterances.
-
-        )
+        # Take a pre-established WebSocket session (or connect now if the pool is empty)
+        ws = await self._acquire_websocket()
+        # Set once the audio queue delivers its None end marker; no further
+        # session will be needed, so the pool is not refilled after that
+        input_ended = False
 
         async def sender():
             """
@@ -79,11 +188,50 @@ class CartesiaASR(ASRInterface):
             
             This coroutine continuously reads audio chunks from the queue
             and sends them to the Cartesia ASR service for processing.
+            Chunks that are already queued are coalesced (up to max_send_bytes)
+            into a single frame to amortize WebSocket/TLS framing overhead; a
+            chunk that would overflow the frame is held for the next one.
+            A None chunk marks the end of the audio stream.
             """
+            # Reused staging buffer for coalesced frames, only overwritten in place
+            send_view = memoryview(bytearray(self.max_send_bytes))
+            nonlocal input_ended
             try:
-                while True:
-                    chunk = await audio_queue.get()
-                    await ws.send(chunk)
+                end_of_stream = False
+                # Chunk taken off the queue that did not fit in the previous frame
+                carry = None
+                while not end_of_stream:
+                    if carry is not None:
+                        chunk, carry = carry, None
+                    else:
+                        chunk = await audio_queue.get()
+                    if chunk is None:
+                        break
+                    if audio_queue.empty() or len(chunk) >= self.max_send_bytes:
+                        await ws.send(chunk)
+                        continue
+
+                    # Drain whatever else is pending into one frame
+                    write_pos = 0
+                    while True:
+                        n = len(chunk)
+                        send_view[write_pos:write_pos + n] = chunk
+                        write_pos += n
+                        if audio_queue.empty():
+                            break
+                        chunk = audio_queue.get_nowait()
+                        if chunk is None:
+                            end_of_stream = True
+                            break
+                        if write_pos + len(chunk) > self.max_send_bytes:
+                            carry = chunk
+                            break
+                    # The SDK only accepts bytes, so this is the single copy per frame
+                    await ws.send(bytes(send_view[:write_pos]))
+
+                # Flush pending audio and close the ASR session
+                input_ended = True
+                await ws.send("done")
             except Exception as e:
                 print(f"[ASR Sender] Error: {e}")
 
@@ -93,58 +241,84 @@ class CartesiaASR(ASRInterface):
             
             This coroutine processes the streaming results from Cartesia,
             including partial transcriptions, final transcriptions, and
-            word-level timing information.
+            word-level timing information. Final segments arriving within
+            final_coalesce_secs of each other are merged into one utterance.
             """
-            full_transcript = ""
-            all_word_timestamps = []
+            manager = self.conversation_manager
+            pending_finals = []
+
+            def take_utterance() -> str:
+                utterance = " ".join(pending_finals)
+                pending_finals.clear()
+                if manager and self.current_session_id == manager.get_current_session_id():
+                    manager.set_state(_PROCESSING)
+                return utterance
+
+            results = ws.receive().__aiter__()
+            next_result = None
             try:
-                async for result in ws.receive():
-                    if result['type'] == 'transcript':
-                        text = result['text'].strip()
-                        is_final = result.get('is_final', False)
-                        if text:
-                            if self.conversation_manager:
-                                current_state = self.conversation_manager.state
-                                if current_state == PipelineState.RESPONDING:
-                                    print(f"[ASR] User speaking detected during response, triggering interrupt...")
-                                    await self.conversation_manager.trigger_interrupt()
-                                    # 🔥 等待中断完成后再继续
-                                    print(f"[ASR] Interrupt completed, continuing with new input...")
-                                self.current_session_id = self.conversation_manager.get_current_session_id()
-
-                        # Process word-level timestamps if available
-                        if 'words' in result and result['words']:
-                            word_timestamps = result['words']
-                            all_word_timestamps.extend(word_timestamps)
-                            
-                            if is_final:
-                                print("Word-level timestamps:")
-                                for word_info in word_timestamps:
-                                    word = word_info['word']
-                                    start = word_info['start']
-                                    end = word_info['end']
-                                    print(f"  '{word}': {start:.2f}s - {end:.2f}s")
-                        
-                        # Only process non-empty text
-                        if not text:
+                while True:
+                    if next_result is None:
+                        next_result = asyncio.ensure_future(results.__anext__())
+                    if pending_finals:
+                        # asyncio.wait() leaves the pending receive running on timeout,
+                        # unlike wait_for(), which would cancel (and close) the stream
+                        done, _ = await asyncio.wait({next_result}, timeout=self.final_coalesce_secs)
+                        if not done:
+                            yield take_utterance()
                             continue
-                        if is_final:
-                            full_transcript += text + " "
-                            if self.conversation_manager:
-                                if self.current_session_id == self.conversation_manager.get_current_session_id():
-                                    self.conversation_manager.set_state(PipelineState.PROCESSING)
-                            yield text
-                        else:
-                            # Optional: could yield partial results for real-time feedback
-                            # Currently skipped to reduce noise in the pipeline
-                            pass
-                    elif result['type'] == 'done':
+                    try:
+                        result = await next_result
+                    except StopAsyncIteration:
+                        break
+                    finally:
+                        next_result = None
+
+                    rtype = result['type']
+                    if rtype == 'done':
                         # ASR session completed
                         break
+                    if rtype != 'transcript':
+                        continue
+
+                    text = result['text'].strip()
+                    is_final = result.get('is_final', False)
+                    words = result.get('words')
+                    if text and manager:
+                        if manager.state is _RESPONDING:
+                            print(f"[ASR] User speaking detected during response, triggering interrupt...")
+                            await manager.trigger_interrupt()
+                            # 🔥 等待中断完成后再继续
+                            print(f"[ASR] Interrupt completed, continuing with new input...")
+                        self.current_session_id = manager.get_current_session_id()
+
+                    # Skip formatting word-level timestamps entirely unless debug logging is on
+                    if words and is_final and logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("[ASR] Word-level timestamps:\n%s", "\n".join(
+                            f"  '{w['word']}': {w['start']:.2f}s - {w['end']:.2f}s"
+                            for w in words))
+                    
+                    # Only process non-empty text
+                    if not text:
+                        continue
+                    if is_final:
+                        pending_finals.append(text)
+                    elif pending_finals:
+                        # User kept talking past the final segment - hand it on now
+                        yield take_utterance()
+
+                if pending_finals:
+                    yield take_utterance()
             except Exception as e:
                 print(f"[ASR Receiver] Error: {e}")
             finally:
+                if next_result is not None:
+                    next_result.cancel()
+                # A finished ASR session cannot be reused; warm up its replacement
+                # unless the audio input is over (it would only be closed unused)
                 await ws.close()
+                if not input_ended:
+                    self._schedule_refill()
 
         # Run sender and receiver concurrently
         # This allows simultaneous audio sending and result receiving
@@ -153,4 +327,3 @@ class CartesiaASR(ASRInterface):
             yield text
 
         await sender_task
-        await self.client.close()
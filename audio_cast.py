@@ -0,0 +1,62 @@
+# audio_cast.py - PCM Sample Format Conversion Kernels
+"""
+This module implements the PCM sample conversion used by the audio player.
+
+When the output device runs in int16 mode, the player scales and casts float32
+TTS output into its int16 ring buffer on the hot path. f32_to_i16_sat does
+that in a single pass: scale, round and saturate float32 samples into int16.
+
+When Numba is installed the kernel is compiled with cache=True, so the
+machine code is written next to this module on first use and later sessions
+start without JIT delay. An indexed array loop like this has no pointer
+aliasing to rule out, so LLVM vectorizes it into packed convert/pack
+instructions. Without Numba, equivalent NumPy ufunc code is used.
+"""
+
+import numpy as np
+from typing import Optional
+
+try:
+    from numba import njit
+except ImportError:  # Numba is optional; the NumPy ufunc path is used instead
+    njit = None
+
+HAVE_NUMBA = njit is not None
+
+if HAVE_NUMBA:
+    @njit(cache=True, fastmath=True, nogil=True)
+    def _f32_to_i16_sat_kernel(src, dst, scale):
+        for i in range(src.shape[0]):
+            v = src[i] * scale
+            if v > 32767.0:
+                v = 32767.0
+            elif v < -32768.0:
+                v = -32768.0
+            dst[i] = np.int16(np.rint(v))
+
+
+def f32_to_i16_sat(src: np.ndarray,
+                   dst: np.ndarray,
+                   scale: float = 32767.0,
+                   scratch: Optional[np.ndarray] = None):
+    """
+    Scale float32 samples to int16 with rounding and saturation.
+
+    Args:
+        src: 1-D float32 samples, nominally in [-1.0, 1.0]
+        dst: 1-D int16 output array of the same length
+        scale: Multiplier applied before rounding
+        scratch: Optional float32 work array of the same length, used only by
+            the NumPy fallback to avoid allocating a temporary
+    """
+    if HAVE_NUMBA:
+        _f32_to_i16_sat_kernel(src, dst, np.float32(scale))
+        return
+
+    if scratch is None:
+        scratch = np.empty(len(src), dtype=np.float32)
+    np.multiply(src, np.float32(scale), out=scratch)
+    np.rint(scratch, out=scratch)
+    np.clip(scratch, -32768.0, 32767.0, out=scratch)
+    np.copyto(dst, scratch, casting='unsafe')
+
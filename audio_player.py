@@ -14,12 +14,49 @@ thread-safe communication with the main async pipeline.
 """
 
 import asyncio
+import collections
+import concurrent.futures
+import ctypes
+import os
+import sys
 import numpy as np
 import sounddevice as sd
+from audio_cast import HAVE_NUMBA, f32_to_i16_sat
 from components import AudioPlayer
-from typing import Optional
-import threading
-from collections import deque
+from typing import Dict, Optional
+from time import monotonic_ns
+
+# TTS wire format (pcm_f32le), parsed once instead of per chunk
+_F32LE = np.dtype('<f4')
+
+
+def _set_realtime_priority(priority: int = 70) -> bool:
+    """
+    Raise the calling thread to a real-time scheduling class.
+    
+    Called from the audio callback so it applies to PortAudio's callback
+    thread. macOS is skipped because CoreAudio already runs its IO thread
+    with a time-constraint policy.
+    
+    Args:
+        priority: SCHED_FIFO priority on Linux (1-99)
+        
+    Returns:
+        bool: True if the priority was raised, False if unsupported or not permitted
+    """
+    try:
+        if sys.platform.startswith('linux'):
+            # pid 0 targets the calling thread; needs CAP_SYS_NICE or an rtprio limit
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+            return True
+        if sys.platform == 'win32':
+            THREAD_PRIORITY_TIME_CRITICAL = 15
+            kernel32 = ctypes.windll.kernel32
+            return bool(kernel32.SetThreadPriority(kernel32.GetCurrentThread(),
+                                                   THREAD_PRIORITY_TIME_CRITICAL))
+    except (OSError, AttributeError):
+        pass
+    return False
 
 class SoundDeviceAudioPlayer(AudioPlayer):
     """
@@ -31,19 +68,27 @@ class SoundDeviceAudioPlayer(AudioPlayer):
     Features:
     - Real-time streaming audio playback
     - Intelligent buffer management with configurable thresholds
+    - Preallocated ring buffer shared with the audio callback (no per-chunk allocation)
     - Underrun detection and recovery
     - Cross-platform compatibility via sounddevice
     - Support for multiple audio formats and sample rates
     - Thread-safe operation with async pipeline
     """
     
+    # Chunks smaller than this convert inline: the thread hop would cost more
+    # than the conversion itself
+    OFFLOAD_MIN_BYTES = 8192
+    
     def __init__(self, 
                  sample_rate: int = 24000, 
                  channels: int = 1,
                  dtype: str = 'float32',
-                 buffer_size: int = 2048,  # Audio callback buffer size
+                 buffer_size: int = 0,  # Audio callback buffer size (0 = device native period)
                  device: Optional[int] = None,
-                 min_buffer_samples: int = 4800):  # Minimum buffer before playback (200ms)
+                 min_buffer_samples: int = 4800,  # Minimum buffer before playback (200ms)
+                 ring_frames: int = 1 << 18,  # Ring buffer capacity (~10.9s at 24kHz)
+                 latency='low',  # PortAudio latency hint ('low', 'high' or seconds)
+                 fp16_ring: bool = False):  # Store float32 playback as float16 in the ring
         """
         Initialize the real-time audio player.
         
@@ -51,28 +96,83 @@ class SoundDeviceAudioPlayer(AudioPlayer):
             sample_rate: Audio sample rate in Hz
             channels: Number of audio channels (1=mono, 2=stereo)
             dtype: Audio data type ('float32' or 'int16')
-            buffer_size: Size of sounddevice callback buffer
+            buffer_size: Size of sounddevice callback buffer; 0 lets PortAudio use
+                the device's native period (e.g. 480 suits WASAPI at 24kHz)
             device: Audio device ID (None for system default)
             min_buffer_samples: Minimum samples to buffer before starting playback
+            ring_frames: Capacity of the playback ring buffer in frames (power of two)
+            latency: Output latency passed to sounddevice. min_buffer_samples is
+                the jitter reservoir, so the device buffer can stay small
+            fp16_ring: Keep ring samples as float16 (float32 output only). Halves
+                ring memory and bandwidth; worthwhile on CPUs with native fp16
+                conversion (ARM NEON, x86 F16C)
         """
+        if ring_frames & (ring_frames - 1):
+            raise ValueError("ring_frames must be a power of two")
+        if ring_frames < min_buffer_samples:
+            raise ValueError("ring_frames must be at least min_buffer_samples")
+        if fp16_ring and dtype != 'float32':
+            raise ValueError("fp16_ring requires dtype='float32'")
+        
         self.sample_rate = sample_rate
         self.channels = channels
         self.dtype = dtype
         self.buffer_size = buffer_size
+        self.latency = latency
         self.device = device
         self.min_buffer_samples = min_buffer_samples
         
-        # Thread-safe audio buffer queue
-        self.audio_buffer = deque()
-        self.buffer_lock = threading.Lock()
+        # Dtype used to view incoming bytes: float32 TTS PCM for both float32 and
+        # int16 output (int16 converts on the ring write), else the raw dtype
+        self._chunk_dtype = _F32LE if dtype in ('float32', 'int16') else np.dtype(dtype)
+        
+        # Preallocated single-producer/single-consumer ring buffer of PCM frames
+        # shared with the audio callback. Read/write indices grow monotonically;
+        # the slot is index & _ring_mask. Only the producer stores _write_idx and
+        # only the callback stores _read_idx, each after its copy completes, and
+        # int attribute stores are atomic under the GIL - so neither side locks.
+        # flush_and_stop() stops the callback and waits out any offloaded write
+        # before resetting, and bumps _flush_gen so _write_audio() drops the
+        # rest of a chunk it was writing when the flush happened.
+        self.ring_frames = ring_frames
+        self._ring = np.zeros((ring_frames, channels), dtype='float16' if fp16_ring else dtype)
+        self._ring_mask = ring_frames - 1
+        self._read_idx = 0
+        self._write_idx = 0
+        self._flush_gen = 0
+        self._pending_write: Optional[asyncio.Future] = None
         
         # Playback state and statistics
         self.is_playing = False
         self.stream = None
-        self.total_samples_buffered = 0
         self.underrun_count = 0
         self.started_playback = False
         
+        # The audio callback must not format strings or write to stdout, so it
+        # records (monotonic_ns, status, missing_frames, underrun_count) tuples here instead and
+        # _drain_status_log() prints them from the event loop
+        self._status_log = collections.deque(maxlen=64)
+        self._frames_added = 0
+        
+        # Real-time priority is requested from the first callback of each stream,
+        # since that is the only code running on PortAudio's callback thread
+        self._prio_set = False
+        self.realtime_priority = False
+        
+        # Set (via the owning loop) by the audio callback when it plays the last
+        # buffered frame; both are bound in play_audio()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._drained: Optional[asyncio.Event] = None
+        
+        # Reusable conversion scratch buffers keyed by dtype (grown on demand),
+        # used by the NumPy fallback when Numba is missing. play_audio awaits each
+        # ring write before the next, so one buffer per dtype is enough.
+        self._scratch_pool: Dict[str, np.ndarray] = {}
+        
+        # Single worker keeps int16 conversion off the event loop while preserving chunk order
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='audio-decode')
+        
         print(f"[AudioPlayer] Initialized with sample_rate={sample_rate}, "
               f"channels={channels}, dtype={dtype}, buffer_size={buffer_size}")
         print(f"[AudioPlayer] Min buffer: {min_buffer_samples} samples ({min_buffer_samples/sample_rate*1000:.1f}ms)")
@@ -91,65 +191,50 @@ class SoundDeviceAudioPlayer(AudioPlayer):
             time: Timing information
             status: Stream status flags
         """
+        if not self._prio_set:
+            self._prio_set = True
+            self.realtime_priority = _set_realtime_priority()
+        
         if status:
-            print(f"[AudioPlayer] Status: {status}")
+            self._status_log.append((monotonic_ns(), status, 0, self.underrun_count))
         
-        with self.buffer_lock:
-            # Wait for minimum buffer before starting playback
-            if not self.started_playback and self.total_samples_buffered < self.min_buffer_samples:
-                # Not enough buffered data yet - output silence
-                outdata.fill(0)
-                return
+        read_idx = self._read_idx
+        available = self._write_idx - read_idx
+        
+        # Wait for minimum buffer before starting playback
+        if not self.started_playback and available < self.min_buffer_samples:
+            # Not enough buffered data yet - output silence
+            outdata.fill(0)
+            return
+        
+        # Start playback once we have sufficient buffer
+        self.started_playback = True
+        
+        n = min(frames, available)
+        if n:
+            # Copy out of the ring, splitting the copy at the wrap point (an fp16
+            # ring is widened to float32 by the same copy)
+            start = read_idx & self._ring_mask
+            first = min(n, self.ring_frames - start)
+            np.copyto(outdata[:first], self._ring[start:start + first])
+            if first < n:
+                np.copyto(outdata[first:n], self._ring[:n - first])
             
-            # Start playback once we have sufficient buffer
-            self.started_playback = True
+            self._read_idx = read_idx + n
             
-            if self.audio_buffer:
-                samples_needed = frames
-                output_pos = 0
-                
-                # Fill output buffer from audio queue
-                while samples_needed > 0 and self.audio_buffer:
-                    try:
-                        audio_chunk = self.audio_buffer[0]  # Peek at first chunk
-                        
-                        if len(audio_chunk) <= samples_needed:
-                            # Use entire chunk
-                            chunk_size = len(audio_chunk)
-                            outdata[output_pos:output_pos + chunk_size] = audio_chunk.reshape(-1, self.channels)
-                            
-                            # Remove used chunk from buffer
-                            self.audio_buffer.popleft()
-                            self.total_samples_buffered -= chunk_size
-                            
-                            output_pos += chunk_size
-                            samples_needed -= chunk_size
-                        else:
-                            # Use partial chunk
-                            outdata[output_pos:output_pos + samples_needed] = audio_chunk[:samples_needed].reshape(-1, self.channels)
-                            
-                            # Keep remaining data
-                            self.audio_buffer[0] = audio_chunk[samples_needed:]
-                            self.total_samples_buffered -= samples_needed
-                            
-                            output_pos += samples_needed
-                            samples_needed = 0
-                            
-                    except Exception as e:
-                        print(f"[AudioPlayer] Error in callback processing: {e}")
-                        break
-                
-                # Fill remaining with silence if needed
-                if samples_needed > 0:
-                    outdata[output_pos:] = 0
-                    self.underrun_count += 1
-                    if self.underrun_count % 10 == 1:  # Log every 10th underrun
-                        print(f"[AudioPlayer] Buffer underrun #{self.underrun_count}, missing {samples_needed} samples")
-            else:
-                # No data available - fill with silence
-                outdata.fill(0)
-                if self.started_playback:
-                    self.underrun_count += 1
+            if n == available and self._loop is not None:
+                # Just played the last buffered frame - wake a pending drain
+                try:
+                    self._loop.call_soon_threadsafe(self._drained.set)
+                except RuntimeError:
+                    pass  # Event loop already closed
+        
+        if n < frames:
+            # Fill remaining with silence
+            outdata[n:].fill(0)
+            self.underrun_count += 1
+            if n and self.underrun_count % 10 == 1:  # Log every 10th underrun
+                self._status_log.append((monotonic_ns(), None, frames - n, self.underrun_count))
 
     def _start_stream(self):
         """
@@ -159,6 +244,7 @@ class SoundDeviceAudioPlayer(AudioPlayer):
         configured parameters and callback function.
         """
         if self.stream is None or not self.stream.active:
+            self._prio_set = False  # New stream, new callback thread
             try:
                 self.stream = sd.OutputStream(
                     samplerate=self.sample_rate,
@@ -167,11 +253,12 @@ class SoundDeviceAudioPlayer(AudioPlayer):
                     callback=self._audio_callback,
                     blocksize=self.buffer_size,
                     device=self.device,
-                    latency='high'  # Use high latency to reduce buffer underruns
+                    latency=self.latency
                 )
                 self.stream.start()
                 self.is_playing = True
-                print(f"[AudioPlayer] Audio stream started with blocksize={self.buffer_size}")
+                print(f"[AudioPlayer] Audio stream started with blocksize={self.buffer_size}, "
+                      f"latency={self.latency}")
             except Exception as e:
                 print(f"[AudioPlayer] Failed to start stream: {e}")
                 raise
@@ -187,19 +274,161 @@ class SoundDeviceAudioPlayer(AudioPlayer):
             self.is_playing = False
             print("[AudioPlayer] Audio stream stopped")
 
-    def _add_audio_chunk(self, audio_data: np.ndarray):
+    def _flush_status_log(self):
+        """Print callback status events and the frames buffered since the last flush."""
+        if self._frames_added:
+            print(f"[AudioPlayer] Added {self._frames_added} samples to buffer")
+            self._frames_added = 0
+        
+        while self._status_log:
+            timestamp_ns, status, missing, underrun = self._status_log.popleft()
+            if status:
+                print(f"[AudioPlayer] Status: {status} (t={timestamp_ns / 1e9:.3f}s)")
+            else:
+                print(f"[AudioPlayer] Buffer underrun #{underrun}, "
+                      f"missing {missing} samples (t={timestamp_ns / 1e9:.3f}s)")
+
+    async def _drain_status_log(self, interval: float = 0.5):
+        """
+        Periodically print events recorded by the audio callback.
+        
+        Args:
+            interval: Seconds between flushes
+        """
+        while True:
+            await asyncio.sleep(interval)
+            self._flush_status_log()
+
+    def _acquire_scratch(self, n: int, dtype: str) -> np.ndarray:
+        """
+        Return a reusable scratch view of n samples, growing the backing array if needed.
+        
+        The returned view is only valid until the next call with the same dtype.
+        
+        Args:
+            n: Number of samples required
+            dtype: NumPy dtype name of the scratch buffer
+            
+        Returns:
+            np.ndarray: View of the first n samples of the scratch buffer
+        """
+        buf = self._scratch_pool.get(dtype)
+        if buf is None or len(buf) < n:
+            buf = np.empty(max(n, self.sample_rate), dtype=dtype)
+            self._scratch_pool[dtype] = buf
+        return buf[:n]
+
+    def _decode_chunk(self, audio_chunk) -> np.ndarray:
         """
-        Add an audio chunk to the playback buffer.
+        View a TTS audio chunk as an array of samples without copying it.
+        
+        TTS always emits float32 PCM, so bytes are reinterpreted in place. For an
+        int16 player the float32 samples are converted on their way into the ring
+        by _store_frames rather than through an intermediate buffer.
         
-        This method safely adds audio data to the buffer queue for
-        consumption by the audio callback thread.
+        Args:
+            audio_chunk: Raw float32 little-endian PCM bytes or a numpy array
+            
+        Returns:
+            np.ndarray: Audio samples (a view over the chunk's memory for bytes)
+        """
+        if not isinstance(audio_chunk, bytes):
+            return audio_chunk
+        return np.frombuffer(audio_chunk, dtype=self._chunk_dtype)
+
+    def _store_frames(self, dst: np.ndarray, src: np.ndarray):
+        """
+        Copy frames into a ring slice, converting to the ring dtype in the same pass.
         
         Args:
-            audio_data: Audio samples as numpy array
+            dst: Contiguous slice of the ring buffer
+            src: Frames to store, with the same shape as dst
         """
-        with self.buffer_lock:
-            self.audio_buffer.append(audio_data)
-            self.total_samples_buffered += len(audio_data)
+        if dst.dtype == src.dtype:
+            np.copyto(dst, src)
+            return
+        if dst.dtype == np.int16 and src.dtype.kind == 'f':
+            # Float PCM into an int16 ring: scale and saturate in one pass
+            src_flat = src.reshape(-1)
+            if src_flat.dtype != np.float32:
+                src_flat = src_flat.astype(np.float32)
+            scratch = None if HAVE_NUMBA else self._acquire_scratch(len(src_flat), 'float32')
+            f32_to_i16_sat(src_flat, dst.reshape(-1), 32767.0, scratch)
+            return
+        # Any other pair (e.g. float64 into a float32/float16 ring) is a plain
+        # value-preserving cast - the int16 scaling must not apply to float rings
+        np.copyto(dst, src, casting='same_kind')
+
+    @property
+    def total_samples_buffered(self) -> int:
+        """Number of frames written to the ring buffer but not yet played."""
+        return self._write_idx - self._read_idx
+
+    def _add_audio_chunk(self, audio_data: np.ndarray) -> int:
+        """
+        Copy an audio chunk into the playback ring buffer.
+        
+        Only as many frames as currently fit are written; the caller is
+        responsible for retrying the remainder once the callback drains space.
+        
+        Args:
+            audio_data: Audio frames shaped (frames, channels)
+            
+        Returns:
+            int: Number of frames written
+        """
+        if audio_data.ndim != 2 or audio_data.shape[1] != self.channels:
+            raise ValueError(f"Expected (frames, {self.channels}) audio, got shape {audio_data.shape}")
+        
+        write_idx = self._write_idx
+        free = self.ring_frames - (write_idx - self._read_idx)
+        
+        n = min(len(audio_data), free)
+        if n:
+            start = write_idx & self._ring_mask
+            first = min(n, self.ring_frames - start)
+            self._store_frames(self._ring[start:start + first], audio_data[:first])
+            if first < n:
+                self._store_frames(self._ring[:n - first], audio_data[first:n])
+            
+            # Publish only after the frames are in place
+            self._write_idx = write_idx + n
+        return n
+
+    async def _write_audio(self, audio_data: np.ndarray):
+        """
+        Write an audio chunk into the ring buffer, waiting for space if it is full.
+        
+        Large chunks that need a dtype conversion are stored from the decode
+        worker thread so the event loop keeps serving ASR/TTS; plain copies and
+        small conversions stay inline.
+        
+        Args:
+            audio_data: Audio frames shaped (frames, channels)
+        """
+        offload = (audio_data.dtype != self._ring.dtype
+                   and audio_data.nbytes >= self.OFFLOAD_MIN_BYTES)
+        loop = asyncio.get_running_loop()
+        flush_gen = self._flush_gen
+        written = 0
+        while True:
+            remaining = audio_data[written:]
+            if offload:
+                # Tracked so flush_and_stop() can wait for the worker to publish
+                self._pending_write = loop.run_in_executor(
+                    self._executor, self._add_audio_chunk, remaining)
+                try:
+                    written += await self._pending_write
+                finally:
+                    self._pending_write = None
+            else:
+                written += self._add_audio_chunk(remaining)
+            if written >= len(audio_data) or self._flush_gen != flush_gen:
+                return  # Done, or flushed meanwhile - the rest is stale
+            # Ring is full - give the device roughly one callback period to drain it
+            await asyncio.sleep((self.buffer_size or 256) / self.sample_rate)
+            if self._flush_gen != flush_gen:
+                return
 
     async def play_audio(self, audio_queue: asyncio.Queue) -> None:
         """
@@ -213,50 +442,69 @@ class SoundDeviceAudioPlayer(AudioPlayer):
         5. Manages graceful shutdown
         
         Args:
-            audio_queue: Queue containing audio chunks to play
+            audio_queue: Queue containing audio chunks to play (None marks end of stream)
         """
+        loop = asyncio.get_running_loop()
+        self._loop = loop
+        self._drained = asyncio.Event()
+        status_task = asyncio.create_task(self._drain_status_log())
+        # Per-chunk hot loop: bind bound methods and constants once
+        decode = self._decode_chunk
+        write_audio = self._write_audio
+        channels = self.channels
+        task_done = audio_queue.task_done
+        get_nowait = audio_queue.get_nowait
         try:
             self._start_stream()
             
             while True:
                 try:
-                    # Get next audio chunk from TTS
+                    # Get next audio chunk from TTS, then drain any burst that is
+                    # already queued without another round-trip through the loop
                     audio_chunk = await audio_queue.get()
-                    # Process audio data based on input format
-                    if isinstance(audio_chunk, bytes):
-                        # Convert bytes to numpy array based on expected format
-                        if self.dtype == 'float32':
-                            audio_array = np.frombuffer(audio_chunk, dtype='<f4')
-                        elif self.dtype == 'int16':
-                            # Convert float32 input to int16 if needed
-                            float_array = np.frombuffer(audio_chunk, dtype='<f4')
-                            audio_array = (float_array * 32767).astype(np.int16)
-                        else:
-                            audio_array = np.frombuffer(audio_chunk, dtype=self.dtype)
-                    else:
-                        audio_array = audio_chunk
-                    
-                    # Add to playback buffer
-                    if len(audio_array) > 0:
-                        self._add_audio_chunk(audio_array)
-                        print(f"[AudioPlayer] Added {len(audio_array)} samples to buffer")
+                    while audio_chunk is not None:
+                        # Zero-copy view, shaped once here; any int16 conversion
+                        # happens on the ring write
+                        audio_array = decode(audio_chunk).reshape(-1, channels)
+                        
+                        # Add to playback buffer
+                        n_frames = len(audio_array)
+                        if n_frames:
+                            await write_audio(audio_array)
+                            self._frames_added += n_frames
+                        
+                        task_done()
+                        try:
+                            audio_chunk = get_nowait()
+                        except asyncio.QueueEmpty:
+                            break
                     
-                    audio_queue.task_done()
+                    if audio_chunk is None:
+                        audio_queue.task_done()
+                        break
                 
                 except asyncio.CancelledError:
+                    # Propagate so a cancelling TaskGroup is not held open while
+                    # the buffer drains; the finally below stops the stream
                     print("[AudioPlayer] Play task cancelled")
-                    break
+                    raise
                 except Exception as e:
                     print(f"[AudioPlayer] Error processing audio: {e}")
                     continue
             
-            # Wait for buffer to drain before stopping
+            # Wait for buffer to drain before stopping; a tail shorter than
+            # min_buffer_samples would otherwise never start playing
             print("[AudioPlayer] Waiting for buffer to drain...")
-            while self.audio_buffer:
-                await asyncio.sleep(0.1)
+            self.started_playback = True
+            while self.total_samples_buffered > 0:
+                self._drained.clear()
+                if self.total_samples_buffered > 0:
+                    await self._drained.wait()
             
         finally:
             self._stop_stream()
+            status_task.cancel()
+            self._flush_status_log()
             print("[AudioPlayer] Audio playback finished")
 
     async def flush_and_stop(self):
@@ -265,25 +513,36 @@ class SoundDeviceAudioPlayer(AudioPlayer):
         
         Useful for interrupting current playback or resetting the player state.
         """
-        with self.buffer_lock:
-            self.audio_buffer.clear()
+        # Make an in-progress _write_audio() drop the rest of its chunk
+        self._flush_gen += 1
+        # Stop first: once the stream is stopped the callback cannot be running,
+        # so moving its read index here cannot race with an in-flight advance
         self._stop_stream()
+        # A write offloaded to the worker thread may still publish _write_idx;
+        # let it land so the reset below covers its frames too
+        if self._pending_write is not None:
+            await asyncio.wait({self._pending_write})
+        self._read_idx = self._write_idx
+        if self._drained is not None:
+            self._drained.set()
 
     def get_buffer_info(self):
         """
         Get current buffer status information for debugging.
         
         Returns:
-            dict: Buffer statistics including queue length, total samples,
-                  buffer duration, playback status, and underrun count
+            dict: Buffer statistics including ring capacity, total samples,
+                  buffer duration, playback status, underrun count and
+                  whether the callback thread runs at real-time priority
         """
-        with self.buffer_lock:
-            buffer_duration_ms = (self.total_samples_buffered / self.sample_rate) * 1000
-            return {
-                'buffer_chunks': len(self.audio_buffer),
-                'total_samples': self.total_samples_buffered,
-                'buffer_duration_ms': buffer_duration_ms,
-                'is_playing': self.is_playing,
-                'started_playback': self.started_playback,
-                'underrun_count': self.underrun_count
-            }
\ No newline at end of file
+        total_samples = self.total_samples_buffered
+        buffer_duration_ms = (total_samples / self.sample_rate) * 1000
+        return {
+            'ring_frames': self.ring_frames,
+            'total_samples': total_samples,
+            'buffer_duration_ms': buffer_duration_ms,
+            'is_playing': self.is_playing,
+            'started_playback': self.started_playback,
+            'underrun_count': self.underrun_count,
+            'realtime_priority': self.realtime_priority
+        }
\ No newline at end of file
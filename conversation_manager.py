@@ -15,12 +15,15 @@ class ConversationManager:
         self.state = PipelineState.LISTENING
         self.interrupt_event = asyncio.Event()
         
-        # 🔥 组件清理完成信号
-        self.cleanup_events: Dict[str, asyncio.Event] = {
-            'llm': asyncio.Event(),
-            'tts': asyncio.Event(), 
-            'audio_player': asyncio.Event()
+        # 🔥 组件清理完成位掩码 - 每个组件一位，全部清零时只唤醒一个Event
+        self.cleanup_bits: Dict[str, int] = {
+            'llm': 0b001,
+            'tts': 0b010,
+            'audio_player': 0b100
         }
+        self._all_cleanup_bits = 0b111
+        self._cleanup_pending = self._all_cleanup_bits
+        self._cleanup_done = asyncio.Event()
         
         # 🔥 版本号机制 - 用于丢弃旧数据
         self.current_session_id = 0
@@ -45,30 +48,28 @@ class ConversationManager:
         self.interrupt_event.set()
         
         # 🔥 等待所有组件清理完成
-        cleanup_tasks = [
-            self.cleanup_events['llm'].wait(),
-            self.cleanup_events['tts'].wait(), 
-            self.cleanup_events['audio_player'].wait()
-        ]
-        
         try:
-            await asyncio.wait_for(asyncio.gather(*cleanup_tasks), timeout=2.0)
+            await asyncio.wait_for(self._cleanup_done.wait(), timeout=2.0)
             print("[ConversationManager] All components cleaned up successfully")
         except asyncio.TimeoutError:
             print("[ConversationManager] Warning: Cleanup timeout, proceeding anyway")
         
         # 重置所有事件
         self.interrupt_event.clear()
-        for event in self.cleanup_events.values():
-            event.clear()
+        self._cleanup_pending = self._all_cleanup_bits
+        self._cleanup_done.clear()
             
         # 🔥 只有在清理完成后才切换到LISTENING
         self.set_state(PipelineState.LISTENING)
         
     def signal_cleanup_complete(self, component: str):
         """组件报告清理完成"""
-        if component in self.cleanup_events:
-            self.cleanup_events[component].set()
+        bit = self.cleanup_bits.get(component)
+        if bit:
+            # 所有回调都在事件循环线程上执行，无需加锁
+            self._cleanup_pending &= ~bit
+            if not self._cleanup_pending:
+                self._cleanup_done.set()
             print(f"[ConversationManager] {component} cleanup complete")
             
     def get_current_session_id(self) -> int:
@@ -14,11 +14,98 @@ being produced, allowing for real-time conversational experiences.
 """
 
 import asyncio
+import logging
 import os
-from anthropic import AsyncAnthropic
+from anthropic import AsyncAnthropic, DefaultAsyncHttpxClient, DEFAULT_CONNECTION_LIMITS
+try:
+    from asyncio import timeout as async_timeout  # Python 3.11+
+except ImportError:  # Older Pythons: same API from the package aiohttp already pulls in
+    from async_timeout import timeout as async_timeout
 from components import LLMInterface
-from typing import AsyncGenerator, List, Dict
+from typing import AsyncGenerator, Awaitable, Callable, List, Dict, Optional
 from conversation_manager import ConversationManager, PipelineState
+
+logger = logging.getLogger(__name__)
+
+# A streamed token ending in one of these closes a natural speech unit, so the
+# coalesced text is flushed to TTS right away
+_FLUSH_CHARS = frozenset(".,!?;: \n。，！？；：")
+
+# An utterance ending in one of these is likely complete, so the response can be
+# requested speculatively before the batching timeout expires
+_TERMINAL_PUNCT = ('.', '?', '!', '。', '？', '！')
+
+# One client (and so one HTTP connection pool) per API key for the whole process
+_shared_clients: Dict[str, AsyncAnthropic] = {}
+
+
+def get_shared_client(api_key: str) -> AsyncAnthropic:
+    """
+    Return the process-wide Anthropic client for an API key, creating it on first use.
+    
+    Sharing the client keeps TLS connections warm across turns and across
+    AnthropicLLM instances instead of each owning a separate pool.
+    
+    Args:
+        api_key: Anthropic API key
+        
+    Returns:
+        AsyncAnthropic: The shared client
+    """
+    client = _shared_clients.get(api_key)
+    if client is None:
+        # Build Limits from the SDK's own class: depending on the SDK version it
+        # uses httpx or httpx2, and rejects objects from the other package.
+        # Keep idle connections for 2 minutes so a turn after a pause skips the
+        # TLS handshake (the httpx default expiry is 5 seconds).
+        limits = type(DEFAULT_CONNECTION_LIMITS)(
+            max_connections=DEFAULT_CONNECTION_LIMITS.max_connections,
+            max_keepalive_connections=4,
+            keepalive_expiry=120
+        )
+        client = AsyncAnthropic(
+            api_key=api_key,
+            http_client=DefaultAsyncHttpxClient(limits=limits)
+        )
+        _shared_clients[api_key] = client
+    return client
+
+
+async def batch_until_idle(queue: asyncio.Queue,
+                           timeout: float,
+                           on_fragment: Optional[Callable[[List[str]], Awaitable[None]]] = None) -> str:
+    """
+    Accumulate text fragments from a queue until it stays idle for `timeout`.
+    
+    This runs on every ASR fragment, so it keeps the per-fragment work to one
+    queue get under a timeout context and a list append; the fragments are
+    joined once when the utterance ends.
+    
+    Args:
+        queue: Queue of text fragments
+        timeout: Seconds without a new fragment after which the utterance is complete
+        on_fragment: Optional coroutine function awaited with the fragment list
+            after each fragment (including the first) is added
+            
+    Returns:
+        str: The fragments joined with single spaces
+    """
+    frags = [(await queue.get()).strip()]
+    logger.debug("[LLM] First text: '%s'", frags[0])
+    while True:
+        if on_fragment is not None:
+            await on_fragment(frags)
+        try:
+            # Unlike wait_for this does not wrap the get() in a new Task per fragment
+            async with async_timeout(timeout):
+                more_text = await queue.get()
+        except asyncio.TimeoutError:
+            # Queue idle beyond timeout → user finished speaking
+            return " ".join(frags)
+        frags.append(more_text.strip())
+        logger.debug("[LLM] Accumulated fragment %d: '%s'", len(frags), frags[-1])
+
+
 class AnthropicLLM(LLMInterface):
     """
     Anthropic Claude-powered Language Model implementation.
@@ -38,7 +125,13 @@ class AnthropicLLM(LLMInterface):
     def __init__(self, 
                  timeout: float = 1.0,
                  model: str = "claude-sonnet-4-20250514",
-                 conversation_manager: ConversationManager=None
+                 conversation_manager: ConversationManager=None,
+                 coalesce_chars: int = 64,
+                 coalesce_secs: float = 0.025,
+                 history_token_budget: int = 4000,
+                 summary_model: Optional[str] = None,
+                 speculative: bool = True,
+                 client: Optional[AsyncAnthropic] = None
                  ):
         """
         Initialize the Anthropic LLM client.
@@ -46,6 +139,17 @@ class AnthropicLLM(LLMInterface):
         Args:
             timeout: Seconds to wait for more text before considering utterance complete
             model: Anthropic model name to use for generation
+            coalesce_chars: Flush streamed tokens to TTS once this many characters are pending
+            coalesce_secs: Flush streamed tokens to TTS once this long has passed since the last flush
+            history_token_budget: Approximate input-token budget for the message history;
+                the oldest messages are dropped once it is exceeded
+            summary_model: Model used to summarize dropped messages in the background,
+                e.g. "claude-3-5-haiku-latest". Each summary is an extra API request
+                billed on top of the conversation, so this is opt-in: None (the
+                default) drops trimmed messages without a summary
+            speculative: Start the response as soon as the utterance ends in terminal
+                punctuation, restarting it if the user keeps talking
+            client: Anthropic client to use (defaults to the shared per-key client)
         """
         self.conversation_manager = conversation_manager
         self.current_session_id = 0
@@ -53,18 +157,32 @@ class AnthropicLLM(LLMInterface):
         
         self.timeout = timeout
         self.model = model
+        self.coalesce_chars = coalesce_chars
+        self.coalesce_secs = coalesce_secs
+        self.history_token_budget = history_token_budget
+        self.summary_model = summary_model
+        self.speculative = speculative
         self.api_key = os.getenv("ANTHROPIC_API_KEY")
-        if not self.api_key:
-            raise ValueError("ANTHROPIC_API_KEY not found in environment")
+        if client is None:
+            if not self.api_key:
+                raise ValueError("ANTHROPIC_API_KEY not found in environment")
+            client = get_shared_client(self.api_key)
         
-        self.client = AsyncAnthropic(api_key=self.api_key)
+        self.client = client
         
-        # Conversation history for maintaining context
+        # Conversation history for maintaining context, with an estimated token
+        # count per message kept in step so trimming never re-measures text
         self.message_history: List[Dict[str, str]] = []
+        self._token_counts: List[int] = []
+        self._history_tokens = 0
+        # Summary of messages trimmed from the history, folded into the system prompt
+        self._history_summary = ""
+        self._unsummarized: List[Dict[str, str]] = []
+        self._summary_task: Optional[asyncio.Task] = None
         # System prompt optimized for voice conversation
         self.system_prompt = "You are a helpful AI assistant in a voice conversation. Keep your responses natural and conversational, as if speaking aloud. Avoid using markdown formatting or complex punctuation."
         
-        print(f"[LLM] Initialized with model: {model}")
+        logger.info("[LLM] Initialized with model: %s", model)
 
     async def generate_stream(self, text_queue: asyncio.Queue) -> AsyncGenerator[str, None]:
         """
@@ -74,32 +192,41 @@ class AnthropicLLM(LLMInterface):
         from the ASR until a timeout occurs, indicating the user has finished speaking.
         Then it generates a streaming response using Claude's API.
         
+        When the accumulated text ends in terminal punctuation the request is
+        started speculatively while the timeout runs; if more text arrives the
+        speculative request is cancelled and rolled back, otherwise its already
+        buffered output is used and the timeout adds no latency.
+        
         Args:
             text_queue: Queue containing text fragments from ASR
             
         Yields:
             str: Response text chunks for streaming TTS synthesis
         """
+        speculative_task = None
+        speculative_queue = None
+        # User message appended by the current speculative task (empty until it
+        # runs), so cancelling it rolls back exactly that turn and nothing older
+        speculative_turn: List[Dict[str, str]] = []
+
+        async def on_fragment(frags: List[str]):
+            nonlocal speculative_task, speculative_queue, speculative_turn
+            if speculative_task is not None:
+                # User kept talking - the speculative response is stale
+                await self._cancel_speculative(speculative_task, speculative_turn)
+                speculative_task = None
+            if self.speculative and frags[-1].endswith(_TERMINAL_PUNCT):
+                # Looks like a complete utterance - get the response going now
+                speculative_queue = asyncio.Queue()
+                speculative_turn = []
+                speculative_task = asyncio.create_task(
+                    self._collect_stream(" ".join(frags), speculative_queue, speculative_turn))
+
         while True:
-            # Step 1: Wait for the first text fragment
-            try:
-                first_text = await text_queue.get()
-                buffer = first_text.strip()
-                print(f"[LLM] First text: '{buffer}'")
-            except asyncio.QueueEmpty:
-                continue
-
-            # Step 2: Accumulate additional text until timeout (user finished speaking)
-            while True:
-                try:
-                    # Non-blocking attempt to get more text with timeout
-                    more_text = await asyncio.wait_for(text_queue.get(), timeout=self.timeout)
-                    buffer += " " + more_text.strip()
-                    print(f"[LLM] Accumulated: '{buffer}'")
-                except asyncio.TimeoutError:
-                    # Queue idle beyond timeout → user finished speaking
-                    print(f"[LLM] Timeout reached. Final input: '{buffer}'")
-                    break
+            # Steps 1-2: Accumulate text fragments until timeout (user finished speaking)
+            speculative_task = None
+            buffer = await batch_until_idle(text_queue, self.timeout, on_fragment)
+            logger.info("[LLM] Timeout reached. Final input: '%s'", buffer)
 
             # Step 3: Generate streaming response if we have valid input
             if buffer.strip():
@@ -112,24 +239,34 @@ class AnthropicLLM(LLMInterface):
                     if self.conversation_manager:
                         self.conversation_manager.set_state(PipelineState.RESPONDING)
                    
-                    async for chunk in self._generate_anthropic_stream(buffer):
+                    if speculative_task is not None:
+                        response_stream = self._iter_queue(speculative_queue)
+                    else:
+                        response_stream = self._generate_anthropic_stream(buffer)
+                    async for chunk in response_stream:
                         if (self.conversation_manager and
                             self.conversation_manager.get_current_session_id() != session_id):
-                            print(f"[LLM] Session expired ({session_id} -> {self.conversation_manager.get_current_session_id()}), stopping...")
+                            logger.info("[LLM] Session expired (%d -> %d), stopping...",
+                                        session_id, self.conversation_manager.get_current_session_id())
                             break
                         if self.conversation_manager and self.conversation_manager.interrupt_event.is_set():
-                            print("[LLM] Interrupted! Stopping generation...")
+                            logger.info("[LLM] Interrupted! Stopping generation...")
                             break
                         yield chunk
                 except Exception as e:
-                    print(f"[LLM] Error generating response: {e}")
+                    logger.error("[LLM] Error generating response: %s", e)
                     yield "I'm sorry, I encountered an error processing your request. "
                 finally:
+                    if speculative_task is not None:
+                        speculative_task.cancel()  # No-op once it has finished
                     # 🔥 报告清理完成
                     if self.conversation_manager:
                         self.conversation_manager.signal_cleanup_complete('llm')
 
-    async def _generate_anthropic_stream(self, user_input: str) -> AsyncGenerator[str, None]:
+    async def _generate_anthropic_stream(self,
+                                         user_input: str,
+                                         appended: Optional[List[Dict[str, str]]] = None
+                                         ) -> AsyncGenerator[str, None]:
         """
         Generate streaming response using Anthropic's Claude API.
         
@@ -138,53 +275,224 @@ class AnthropicLLM(LLMInterface):
         
         Args:
             user_input: The complete user utterance to respond to
+            appended: Optional list that receives the user message added to the
+                history, so the caller can roll this turn back
             
         Yields:
             str: Response text chunks for real-time synthesis
         """
         try:
             # Add user message to conversation history
-            self.message_history.append({"role": "user", "content": user_input})
+            user_message = self._append_history("user", user_input)
+            if appended is not None:
+                appended.append(user_message)
             
-            # Maintain reasonable history length (last 10 conversation turns)
-            if len(self.message_history) > 20:  # 10 turns = 20 messages
-                self.message_history = self.message_history[-20:]
+            # Keep the request size roughly constant over a long conversation
+            self._trim_history()
             
-            print(f"[LLM] Sending to Anthropic: '{user_input}'")
-            print(f"[LLM] Message history length: {len(self.message_history)}")
+            logger.debug("[LLM] Sending to Anthropic: '%s'", user_input)
+            logger.debug("[LLM] Message history length: %d", len(self.message_history))
             
-            # Prepare request with conversation history
-            messages = self.message_history.copy()
-            
-            # Call Anthropic API with streaming
-            assistant_response = ""
+            # Call Anthropic API with streaming. SDK chunks are often only a few
+            # characters, so they are coalesced until a punctuation/whitespace
+            # boundary, coalesce_chars, or coalesce_secs - whichever comes first.
+            response_parts: List[str] = []
+            loop = asyncio.get_running_loop()
+            pending: List[str] = []
+            pending_len = 0
+            last_flush = loop.time()
             async with self.client.messages.stream(
                 model=self.model,
                 max_tokens=1024,
-                system=self.system_prompt,
-                messages=messages
+                system=self._effective_system_prompt(),
+                # Passed without copying: the SDK serializes the request body when
+                # the stream opens and never mutates the list, and the history is
+                # only appended to after the response completes
+                messages=self.message_history
             ) as stream:
                 async for text in stream.text_stream:
                     if text:
-                        assistant_response += text
-                        # Stream text chunks for real-time TTS synthesis
-                        yield text + " "
-                        
+                        response_parts.append(text)
+                        pending.append(text)
+                        pending_len += len(text)
+                        now = loop.time()
+                        if (text[-1] in _FLUSH_CHARS
+                                or pending_len >= self.coalesce_chars
+                                or now - last_flush >= self.coalesce_secs):
+                            # Stream text chunks for real-time TTS synthesis
+                            yield "".join(pending) + " "
+                            pending.clear()
+                            pending_len = 0
+                            last_flush = now
+            
+            if pending:
+                yield "".join(pending) + " "
             
             # Add assistant response to conversation history
-            if assistant_response.strip():
-                self.message_history.append({
-                    "role": "assistant", 
-                    "content": assistant_response.strip()
-                })
-                print(f"[LLM] Assistant response completed: '{assistant_response[:100]}...'")
+            assistant_response = "".join(response_parts).strip()
+            if assistant_response:
+                self._append_history("assistant", assistant_response)
+                logger.info("[LLM] Assistant response completed: '%s...'", assistant_response[:100])
         
         except Exception as e:
-            print(f"[LLM] Error in Anthropic API call: {e}")
+            logger.error("[LLM] Error in Anthropic API call: %s", e)
             error_response = "I apologize, but I'm having trouble processing your request right now."
-            self.message_history.append({"role": "assistant", "content": error_response})
+            self._append_history("assistant", error_response)
             yield error_response + " "
 
+    async def _collect_stream(self,
+                              user_input: str,
+                              out: asyncio.Queue,
+                              appended: Optional[List[Dict[str, str]]] = None):
+        """
+        Run a response stream in the background, buffering its chunks.
+        
+        Args:
+            user_input: The utterance to respond to
+            out: Queue receiving response chunks, followed by None when done
+            appended: Optional list that receives the user message this task adds
+                to the history
+        """
+        try:
+            async for chunk in self._generate_anthropic_stream(user_input, appended):
+                out.put_nowait(chunk)
+        finally:
+            out.put_nowait(None)
+
+    @staticmethod
+    async def _iter_queue(queue: asyncio.Queue) -> AsyncGenerator[str, None]:
+        """
+        Yield chunks buffered by _collect_stream until its end marker.
+        
+        Args:
+            queue: Queue filled by _collect_stream
+            
+        Yields:
+            str: Response text chunks
+        """
+        while True:
+            chunk = await queue.get()
+            if chunk is None:
+                return
+            yield chunk
+
+    async def _cancel_speculative(self, task: asyncio.Task, appended: List[Dict[str, str]]):
+        """
+        Cancel a speculative response and remove its turn from the history.
+        
+        Args:
+            task: The _collect_stream task to cancel
+            appended: The holder passed to that task; empty if it never got to
+                append its user message
+        """
+        task.cancel()
+        # Let it unwind (closing the HTTP stream) before touching the history
+        await asyncio.gather(task, return_exceptions=True)
+        
+        if not appended:
+            logger.debug("[LLM] Speculative response cancelled before it started")
+            return
+        user_message = appended[0]
+        for i in range(len(self.message_history) - 1, -1, -1):
+            if self.message_history[i] is user_message:
+                # Drop the user turn and any reply that had already completed
+                del self.message_history[i:]
+                self._history_tokens -= sum(self._token_counts[i:])
+                del self._token_counts[i:]
+                break
+        logger.debug("[LLM] Speculative response cancelled")
+
+    @staticmethod
+    def _estimate_tokens(text: str) -> int:
+        """
+        Cheaply estimate the token count of a message.
+        
+        Counting with the API would add a network round-trip per message, so
+        this uses the usual heuristics instead: about four ASCII characters per
+        token, and about one token per non-ASCII (e.g. CJK) character.
+        
+        Args:
+            text: Message content
+            
+        Returns:
+            int: Estimated number of tokens
+        """
+        non_ascii = len(text) - len(text.encode("ascii", "ignore"))
+        return non_ascii + (len(text) - non_ascii) // 4 + 1
+
+    def _append_history(self, role: str, content: str) -> Dict[str, str]:
+        """
+        Append a message to the history and record its estimated token count.
+        
+        Args:
+            role: 'user' or 'assistant'
+            content: Message text
+            
+        Returns:
+            Dict[str, str]: The appended message
+        """
+        n_tokens = self._estimate_tokens(content)
+        message = {"role": role, "content": content}
+        self.message_history.append(message)
+        self._token_counts.append(n_tokens)
+        self._history_tokens += n_tokens
+        return message
+
+    def _trim_history(self):
+        """
+        Drop the oldest messages until the history fits the token budget.
+        
+        The newest message is always kept, and the history is never left
+        starting with an assistant turn. Dropped messages are handed to a
+        background summarization once enough of them have accumulated.
+        """
+        while len(self.message_history) > 1 and (
+                self._history_tokens > self.history_token_budget
+                or self.message_history[0]["role"] == "assistant"):
+            self._unsummarized.append(self.message_history.pop(0))
+            self._history_tokens -= self._token_counts.pop(0)
+        
+        if (self.summary_model and len(self._unsummarized) >= 6
+                and (self._summary_task is None or self._summary_task.done())):
+            dropped, self._unsummarized = self._unsummarized, []
+            self._summary_task = asyncio.create_task(self._summarize(dropped))
+
+    async def _summarize(self, dropped: List[Dict[str, str]]):
+        """
+        Fold dropped messages into the running conversation summary.
+        
+        Runs in the background with the cheaper summary model so it never
+        delays a response; the result is used from the next request on.
+        
+        Args:
+            dropped: Messages removed from the history, oldest first
+        """
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in dropped)
+        if self._history_summary:
+            transcript = f"Earlier summary: {self._history_summary}\n{transcript}"
+        try:
+            response = await self.client.messages.create(
+                model=self.summary_model,
+                max_tokens=256,
+                system="Summarize this conversation in a few sentences, keeping names, facts and open questions.",
+                messages=[{"role": "user", "content": transcript}]
+            )
+            self._history_summary = response.content[0].text.strip()
+            logger.debug("[LLM] History summary updated: '%s'", self._history_summary)
+        except Exception as e:
+            logger.error("[LLM] Error summarizing history: %s", e)
+
+    def _effective_system_prompt(self) -> str:
+        """
+        Return the system prompt, including the summary of trimmed history if any.
+        
+        Returns:
+            str: System prompt to send with the next request
+        """
+        if not self._history_summary:
+            return self.system_prompt
+        return f"{self.system_prompt}\n\nSummary of the earlier conversation: {self._history_summary}"
+
     def get_conversation_history(self) -> List[Dict[str, str]]:
         """
         Get the current conversation history.
@@ -201,7 +509,13 @@ class AnthropicLLM(LLMInterface):
         Useful for starting fresh conversations or managing memory usage.
         """
         self.message_history.clear()
-        print("[LLM] Conversation history cleared")
+        self._token_counts.clear()
+        self._history_tokens = 0
+        self._history_summary = ""
+        self._unsummarized.clear()
+        if self._summary_task is not None:
+            self._summary_task.cancel()
+        logger.info("[LLM] Conversation history cleared")
 
     def set_system_prompt(self, prompt: str):
         """
@@ -211,4 +525,4 @@ class AnthropicLLM(LLMInterface):
             prompt: New system prompt to use for guiding the assistant's behavior
         """
         self.system_prompt = prompt
-        print(f"[LLM] System prompt updated: '{prompt[:50]}...'")
\ No newline at end of file
+        logger.info("[LLM] System prompt updated: '%s...'", prompt[:50])
\ No newline at end of file
@@ -12,6 +12,7 @@ The entire pipeline runs asynchronously with queue-based communication between s
 """
 
 import asyncio
+import logging
 from dotenv import load_dotenv
 from sources import RealTimeMicrophoneSource
 from asr import CartesiaASR
@@ -21,6 +22,9 @@ from audio_player import SoundDeviceAudioPlayer
 from conversation_manager import ConversationManager,PipelineState
 # Load environment variables from .env file
 load_dotenv()
+
+logger = logging.getLogger(__name__)
+
 if __name__ == "__main__":
     
     async def test_asr():
@@ -34,7 +38,8 @@ if __name__ == "__main__":
         4. TTS synthesizes response text to audio
         5. Audio player outputs synthesized speech
         
-        All stages run concurrently using asyncio.gather() for optimal performance.
+        All stages run concurrently in a task group, so a failure in one stage
+        cancels the rest.
         """
         conversation_manager = ConversationManager()
         # Initialize all pipeline components
@@ -45,19 +50,26 @@ if __name__ == "__main__":
         player = SoundDeviceAudioPlayer()
         
         # Create async queues as buffers between pipeline stages
-        audio_queue = asyncio.Queue()        # Raw audio chunks (bytes)
-        text_queue = asyncio.Queue()         # Transcribed text fragments (str)
-        response_queue = asyncio.Queue()     # LLM response chunks (str)
-        tts_chunk_queue = asyncio.Queue()    # Synthesized audio chunks (bytes)
+        # Bounded so a slow consumer backpressures its producer instead of growing memory;
+        # each size bounds how much queueing delay that stage can accumulate
+        audio_queue = asyncio.Queue(maxsize=50)        # Raw audio chunks (bytes), None = end; 50 x 100ms = 5s
+        text_queue = asyncio.Queue(maxsize=32)         # Transcribed text fragments (str)
+        response_queue = asyncio.Queue(maxsize=128)    # LLM response chunks (str); absorbs token bursts
+        tts_chunk_queue = asyncio.Queue(maxsize=16)    # Synthesized audio chunks (bytes), None = end; small so player lag throttles TTS
+        
+        # Open the ASR WebSocket before capture starts, so the first audio
+        # chunk is sent without waiting for a TLS/WebSocket handshake
+        await asr.prewarm()
         
         async def audio_producer():
             """
             Stage 1: Audio Capture
             Continuously captures audio from microphone and feeds it to the ASR queue.
-            Sends END signal when audio capture is complete.
+            Sends None when audio capture is complete.
             """
             async for chunk in audio_source.stream_audio():
                 await audio_queue.put(chunk)
+            await audio_queue.put(None)
 
         async def text_producer():
             """
@@ -67,6 +79,7 @@ if __name__ == "__main__":
             """
             async for text in asr.transcribe_stream(audio_queue):
                 await text_queue.put(text)
+            await asr.close()
 
         async def llm_interface():
             """
@@ -75,7 +88,7 @@ if __name__ == "__main__":
             Implements intelligent batching to wait for complete user utterances.
             """
             async for response_text in llm.generate_stream(text_queue):
-                print(f"[LLM] Generated response: {response_text}")
+                logger.debug("[LLM] Generated response: %s", response_text)
                 await response_queue.put(response_text)
 
         async def tts_interface():
@@ -86,6 +99,7 @@ if __name__ == "__main__":
             """
             async for audio_chunk in tts.synthesize_stream(response_queue,tts_chunk_queue):
                 await tts_chunk_queue.put(audio_chunk)
+            await tts_chunk_queue.put(None)
         
         async def player_interface():
             """
@@ -98,13 +112,39 @@ if __name__ == "__main__":
         # 启动生产者和转录器
         # Launch all pipeline stages concurrently
         # Each stage runs independently and communicates via async queues
-        await asyncio.gather(
-            audio_producer(),    # Stage 1: Audio capture
-            text_producer(),     # Stage 2: Speech recognition
-            llm_interface(),     # Stage 3: LLM processing
-            tts_interface(),     # Stage 4: Text-to-speech
-            player_interface()   # Stage 5: Audio playback
+        stages = (
+            audio_producer,      # Stage 1: Audio capture
+            text_producer,       # Stage 2: Speech recognition
+            llm_interface,       # Stage 3: LLM processing
+            tts_interface,       # Stage 4: Text-to-speech
+            player_interface     # Stage 5: Audio playback
         )
+        if hasattr(asyncio, "TaskGroup"):
+            # Python 3.11+: the first failing stage cancels all the others, so the
+            # mic is released and no further LLM/TTS work is paid for
+            async with asyncio.TaskGroup() as tg:
+                for stage in stages:
+                    tg.create_task(stage())
+        else:
+            tasks = [asyncio.ensure_future(stage()) for stage in stages]
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                # gather() raises on the first error but leaves siblings running
+                for task in tasks:
+                    task.cancel()
+
+    # Use uvloop's libuv-backed event loop when available; it cuts per-await
+    # overhead on the websocket and queue hand-offs between pipeline stages.
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+
+    # Components log with their own "[Component]" prefixes; set DEBUG here to
+    # see per-fragment and per-token messages
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
 
     # Run the main async function
     asyncio.run(test_asr())
\ No newline at end of file
@@ -9,18 +9,32 @@ suitable for real-time speech recognition.
 Key features:
 - Low-latency audio capture (100ms chunks)
 - Cross-platform compatibility via sounddevice
-- Thread-safe buffering for real-time streaming
+- Callback-to-event-loop handoff without polling
 - Configurable audio parameters (sample rate, channels, etc.)
 """
 
 import asyncio
 import os
 import sounddevice as sd
-import numpy as np
+from time import monotonic
 from components import AudioSource
-from typing import AsyncGenerator, Any
-import threading
-from collections import deque
+from typing import AsyncGenerator, Any, List, Optional, Sequence
+
+# Chunk size written by RealTimeMicrophoneSource.calibrate() and picked up by
+# later instances that do not pass chunk_duration_ms explicitly
+CALIBRATION_FILE = os.path.expanduser("~/.voice_agent_chunk_ms")
+
+# Chunk duration is the latency floor of the whole pipeline: ASR cannot see a
+# word before the chunk containing it is sent. Smaller chunks cut that floor but
+# mean more callbacks and websocket frames per second, and on a loaded host the
+# capture thread starts overflowing - so calibrate() tries these smallest-first.
+CANDIDATE_CHUNK_MS = (20, 40, 60, 100, 200)
+
+# Captured audio allowed to wait for the consumer before the oldest is dropped,
+# so a stalled ASR stage cannot grow the backlog (and its latency) without bound
+MAX_QUEUED_MS = 2000
+
+
 class RealTimeMicrophoneSource(AudioSource):
     """
     Real-time microphone audio source implementation.
@@ -28,24 +42,40 @@ class RealTimeMicrophoneSource(AudioSource):
     Captures audio from the system microphone and provides it as a continuous stream
     of audio chunks. Uses sounddevice for cross-platform audio input with low latency.
     
-    The audio is captured in a separate thread and buffered in a thread-safe queue
-    for consumption by the async audio processing pipeline.
+    The audio is captured in a separate thread and handed to the event loop with
+    call_soon_threadsafe, so the async consumer wakes as soon as a chunk arrives.
     """
     
     def __init__(self, 
                  sample_rate: int = 16000, 
                  channels: int = 1,
-                 chunk_duration_ms: int = 100,  # 100ms chunks
-                 device: int = None):
+                 chunk_duration_ms: Optional[int] = None,  # None = calibrated value, else 100ms
+                 device: int = None,
+                 blocksize: Optional[int] = None,
+                 batch_chunks: int = 1):
         """
         Initialize the real-time microphone source.
         
         Args:
             sample_rate: Audio sample rate in Hz (16kHz is optimal for speech)
             channels: Number of audio channels (1 for mono, 2 for stereo)
-            chunk_duration_ms: Duration of each audio chunk in milliseconds
+            chunk_duration_ms: Duration of each audio chunk in milliseconds. When
+                None, the value saved by calibrate() is used, falling back to 100
             device: Audio device ID (None for system default)
+            blocksize: Frames per PortAudio callback (None = one chunk per callback,
+                0 = the device's native period, giving variable-size chunks)
+            batch_chunks: Number of captured chunks joined into each yielded chunk.
+                Higher values mean fewer queue wakeups and ASR frames per second,
+                at the cost of (batch_chunks - 1) chunk durations of extra latency
         """
+        if chunk_duration_ms is None:
+            chunk_duration_ms = self._load_calibrated_chunk_ms()
+            if chunk_duration_ms is None:
+                chunk_duration_ms = 100
+            else:
+                print(f"[MicSource] Using calibrated chunk duration {chunk_duration_ms}ms "
+                      f"from {CALIBRATION_FILE}")
+        
         self.sample_rate = sample_rate
         self.channels = channels
         self.chunk_duration_ms = chunk_duration_ms
@@ -55,12 +85,22 @@ class RealTimeMicrophoneSource(AudioSource):
         self.chunk_samples = int(sample_rate * chunk_duration_ms / 1000)
         # Calculate bytes per chunk for 16-bit PCM audio
         self.chunk_bytes = self.chunk_samples * channels * 2
+        self.blocksize = self.chunk_samples if blocksize is None else blocksize
+        self.batch_chunks = max(1, batch_chunks)
+        # Chunks captured towards the next batch (only touched by the audio thread)
+        self._pending_chunks: List[bytes] = []
         
-        # Thread-safe audio buffer for storing captured audio chunks
-        self.audio_buffer = deque()
-        self.buffer_lock = threading.Lock()
+        # Captured chunks are queued on the event loop that runs stream_audio();
+        # both are bound in start(). None in the queue ends the stream.
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._audio_queue: Optional[asyncio.Queue] = None
         self.recording = False
         self.stream = None
+        # Callbacks reporting an input overflow/underflow, used by calibrate()
+        self.xrun_count = 0
+        self.last_status = None
+        # Chunks discarded because the consumer fell MAX_QUEUED_MS behind
+        self.dropped_chunks = 0
         
         print(f"[MicSource] Initialized: {sample_rate}Hz, {channels}ch, "
               f"{chunk_duration_ms}ms chunks ({self.chunk_samples} samples)")
@@ -73,22 +113,67 @@ class RealTimeMicrophoneSource(AudioSource):
         new audio data is available from the microphone.
         
         Args:
-            indata: Input audio data as numpy array
+            indata: Raw int16 PCM input buffer (CFFI buffer from RawInputStream)
             frames: Number of audio frames
             time: Time information
             status: Stream status flags
         """
         if status:
-            print(f"[MicSource] Recording status: {status}")
+            # Only count here: printing could block the realtime thread on stdout.
+            # stream_audio() reports new xruns from the event loop side.
+            self.xrun_count += 1
+            self.last_status = status
         
         if self.recording:
-            # Convert from float32 [-1.0, 1.0] to int16 PCM format
-            audio_int16 = (indata * 32767).astype(np.int16)
-            audio_bytes = audio_int16.tobytes()
+            # PortAudio already delivers int16 PCM: one memcpy out of its buffer,
+            # which is only valid for the duration of this callback
+            audio_bytes = bytes(indata)
+            if self.batch_chunks > 1:
+                self._pending_chunks.append(audio_bytes)
+                if len(self._pending_chunks) < self.batch_chunks:
+                    return
+                audio_bytes = b''.join(self._pending_chunks)
+                self._pending_chunks.clear()
             
-            # Thread-safe addition to buffer
-            with self.buffer_lock:
-                self.audio_buffer.append(audio_bytes)
+            # Hand off to the event loop; the consumer wakes without polling
+            try:
+                self._loop.call_soon_threadsafe(self._enqueue, self._audio_queue, audio_bytes)
+            except RuntimeError:
+                pass  # Event loop already closed
+
+    def _enqueue(self, queue: asyncio.Queue, audio_chunk: Optional[bytes]):
+        """
+        Queue a captured chunk for stream_audio(), dropping the oldest if the queue is full.
+        
+        Runs on the event loop thread (scheduled by the audio callback), since
+        asyncio.Queue is not thread-safe. The queue is captured when the call is
+        scheduled, so a late chunk or end marker from a finished recording
+        cannot land in the queue of a newer one started by start().
+        
+        Args:
+            queue: The recording's queue at the time the call was scheduled
+            audio_chunk: PCM chunk, or None to end the stream
+        """
+        if queue.full():
+            # Consumer is behind - drop the stalest audio rather than block or
+            # grow without bound, so what ASR receives next is recent speech
+            queue.get_nowait()
+            self.dropped_chunks += 1
+            if self.dropped_chunks == 1:
+                print("[MicSource] Consumer falling behind, dropping oldest audio")
+        queue.put_nowait(audio_chunk)
+
+    async def start(self):
+        """
+        Bind the capture queue to the running event loop.
+        
+        Must run inside the loop that will consume the audio: on Python < 3.10
+        an asyncio.Queue built outside it (e.g. in __init__ or at import time)
+        binds to a different loop and fails with "attached to a different loop".
+        """
+        self._loop = asyncio.get_running_loop()
+        self._audio_queue = asyncio.Queue(
+            maxsize=max(1, MAX_QUEUED_MS // (self.chunk_duration_ms * self.batch_chunks)))
 
     async def stream_audio(self) -> AsyncGenerator[bytes, None]:
         """
@@ -100,14 +185,17 @@ class RealTimeMicrophoneSource(AudioSource):
         Yields:
             bytes: Audio chunks in 16-bit PCM format
         """
+        await self.start()
+        self._pending_chunks.clear()  # Drop a partial batch from a previous recording
         try:
-            # Initialize and start the audio input stream
-            self.stream = sd.InputStream(
+            # Initialize and start the audio input stream. Raw int16 capture lets
+            # PortAudio produce the PCM format ASR expects, so Python converts nothing
+            self.stream = sd.RawInputStream(
                 samplerate=self.sample_rate,
                 channels=self.channels,
-                dtype=np.float32,
+                dtype='int16',
                 callback=self._audio_callback,
-                blocksize=self.chunk_samples,
+                blocksize=self.blocksize,
                 device=self.device,
                 latency='low'  # Optimize for low latency
             )
@@ -116,15 +204,17 @@ class RealTimeMicrophoneSource(AudioSource):
             self.recording = True
             print("[MicSource] Started recording...")
             
-            # Continuously yield audio chunks as they become available
+            # Yield audio chunks as the callback delivers them
+            reported_xruns = self.xrun_count
             while self.recording:
-                with self.buffer_lock:
-                    if self.audio_buffer:
-                        audio_chunk = self.audio_buffer.popleft()
-                        yield audio_chunk
-                
-                # Small delay to prevent busy waiting
-                await asyncio.sleep(0.01)
+                audio_chunk = await self._audio_queue.get()
+                if audio_chunk is None:
+                    break
+                if self.xrun_count != reported_xruns:
+                    print(f"[MicSource] Recording status: {self.last_status} "
+                          f"({self.xrun_count - reported_xruns} new, {self.xrun_count} total)")
+                    reported_xruns = self.xrun_count
+                yield audio_chunk
         
         except Exception as e:
             print(f"[MicSource] Recording error: {e}")
@@ -136,13 +226,24 @@ class RealTimeMicrophoneSource(AudioSource):
         Stop audio recording and clean up resources.
         
         This method stops the audio stream, closes it, and resets the recording state.
-        It's automatically called when stream_audio() exits.
+        It's automatically called when stream_audio() exits; calling it again
+        once recording has stopped is a no-op.
         """
+        if not self.recording:
+            return
         self.recording = False
+        if self._loop is not None and self._audio_queue is not None:
+            # Wake a consumer blocked in stream_audio(); safe from any thread
+            try:
+                self._loop.call_soon_threadsafe(self._enqueue, self._audio_queue, None)
+            except RuntimeError:
+                pass  # Event loop already closed
         if self.stream and self.stream.active:
             self.stream.stop()
             self.stream.close()
             self.stream = None
+        if self.dropped_chunks:
+            print(f"[MicSource] Dropped {self.dropped_chunks} chunks while the consumer was behind")
         print("[MicSource] Recording stopped")
 
     async def record_for_duration(self, duration_seconds: float) -> AsyncGenerator[bytes, None]:
@@ -158,13 +259,78 @@ class RealTimeMicrophoneSource(AudioSource):
         Yields:
             bytes: Audio chunks during the recording period
         """
-        import time
-        start_time = time.time()
+        # Monotonic clock: a wall-clock (NTP) adjustment cannot cut or extend the recording
+        start_time = monotonic()
         
-        async for chunk in self.stream_audio():
-            yield chunk
+        audio_stream = self.stream_audio()
+        try:
+            async for chunk in audio_stream:
+                yield chunk
+                
+                # Check if we've exceeded the specified duration
+                if monotonic() - start_time >= duration_seconds:
+                    self.stop_recording()
+                    break
+        finally:
+            # Run stream_audio()'s cleanup now rather than whenever the loop
+            # finalizes the generator, which could stop a later recording
+            await audio_stream.aclose()
+                
+    @staticmethod
+    def _load_calibrated_chunk_ms() -> Optional[int]:
+        """
+        Read the chunk duration saved by calibrate(), if any.
+        
+        Only values from CANDIDATE_CHUNK_MS are accepted, so a corrupt or
+        hand-edited file cannot produce a nonsensical blocksize or queue size.
+        
+        Returns:
+            Optional[int]: Calibrated chunk duration in milliseconds, or None
+        """
+        try:
+            with open(CALIBRATION_FILE) as f:
+                chunk_ms = int(f.read().strip())
+        except (OSError, ValueError):
+            return None
+        if chunk_ms not in CANDIDATE_CHUNK_MS:
+            print(f"[MicSource] Ignoring invalid calibrated chunk duration "
+                  f"{chunk_ms}ms in {CALIBRATION_FILE}")
+            return None
+        return chunk_ms
+
+    @classmethod
+    async def calibrate(cls,
+                        duration_s: float = 5.0,
+                        candidates: Sequence[int] = CANDIDATE_CHUNK_MS,
+                        **kwargs) -> int:
+        """
+        Find the smallest chunk duration this host can capture without overflows.
+        
+        Records for duration_s at each candidate size, smallest first, and keeps
+        the first one whose callbacks reported no input overflow/underflow. The
+        result is saved to CALIBRATION_FILE for later instances (which only
+        pick it up if it is one of CANDIDATE_CHUNK_MS).
+        
+        Args:
+            duration_s: Seconds to record at each candidate size
+            candidates: Chunk durations to try, in milliseconds
+            **kwargs: Other RealTimeMicrophoneSource arguments (device, sample_rate, ...)
             
-            # Check if we've exceeded the specified duration
-            if time.time() - start_time >= duration_seconds:
-                self.stop_recording()
-                break
\ No newline at end of file
+        Returns:
+            int: The chosen chunk duration in milliseconds
+        """
+        candidates = sorted(candidates)
+        best = candidates[-1]
+        for chunk_ms in candidates:
+            source = cls(chunk_duration_ms=chunk_ms, **kwargs)
+            async for _ in source.record_for_duration(duration_s):
+                pass
+            print(f"[MicSource] Calibration: {chunk_ms}ms chunks -> {source.xrun_count} xruns")
+            if source.xrun_count == 0:
+                best = chunk_ms
+                break
+        
+        with open(CALIBRATION_FILE, "w") as f:
+            f.write(str(best))
+        print(f"[MicSource] Calibrated chunk duration: {best}ms (saved to {CALIBRATION_FILE})")
+        return best
@@ -0,0 +1,37 @@
+# tests/test_audio_player.py - Ring buffer writes in SoundDeviceAudioPlayer
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+try:
+    from audio_player import SoundDeviceAudioPlayer
+except (ImportError, OSError) as e:  # sounddevice or the PortAudio library missing
+    SoundDeviceAudioPlayer = None
+    _import_error = e
+
+
+@unittest.skipIf(SoundDeviceAudioPlayer is None, "sounddevice/PortAudio unavailable")
+class RingWriteTest(unittest.TestCase):
+
+    def _ring_contents(self, player, n):
+        return player._ring[:n, 0]
+
+    def test_float64_into_float32_ring_keeps_values(self):
+        player = SoundDeviceAudioPlayer(ring_frames=8192)
+        chunk = np.full((100, 1), 0.5, dtype=np.float64)
+        self.assertEqual(player._add_audio_chunk(chunk), 100)
+        np.testing.assert_array_equal(self._ring_contents(player, 100), np.float32(0.5))
+
+    def test_float_into_int16_ring_scales_and_saturates(self):
+        player = SoundDeviceAudioPlayer(dtype='int16', ring_frames=8192)
+        chunk = np.array([[0.5], [2.0], [-2.0]], dtype=np.float64)
+        self.assertEqual(player._add_audio_chunk(chunk), 3)
+        np.testing.assert_array_equal(self._ring_contents(player, 3), [16384, 32767, -32768])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+# tests/test_llm_speculative.py - Speculative response rollback in AnthropicLLM
+import asyncio
+import os
+import sys
+import types
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from llm import AnthropicLLM
+
+
+class _FakeStream:
+    """Minimal stand-in for the SDK's messages.stream() context manager."""
+
+    def __init__(self, reply: str):
+        self.reply = reply
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    @property
+    def text_stream(self):
+        async def gen():
+            for word in self.reply.split(" "):
+                await asyncio.sleep(0)
+                yield word + " "
+        return gen()
+
+
+def _fake_client():
+    def stream(**kwargs):
+        return _FakeStream("Reply to " + kwargs["messages"][-1]["content"])
+    return types.SimpleNamespace(messages=types.SimpleNamespace(stream=stream))
+
+
+class SpeculativeRollbackTest(unittest.TestCase):
+
+    async def _wait_for_history(self, llm, length):
+        for _ in range(200):
+            if len(llm.message_history) >= length:
+                return
+            await asyncio.sleep(0.01)
+        self.fail(f"history never reached {length} messages: {llm.message_history}")
+
+    def test_cancel_before_start_keeps_previous_turn(self):
+        async def main():
+            llm = AnthropicLLM(timeout=0.05, client=_fake_client(), summary_model=None)
+            queue = asyncio.Queue()
+
+            async def consume():
+                async for _ in llm.generate_stream(queue):
+                    pass
+            consumer = asyncio.create_task(consume())
+
+            # Turn 1 completes normally
+            queue.put_nowait("Hi.")
+            await self._wait_for_history(llm, 2)
+            await asyncio.sleep(0.1)  # Let the batching timeout end the turn
+
+            # Turn 2: both fragments are already queued, so the speculative task
+            # started for "Hi." is cancelled before it ever runs
+            queue.put_nowait("Hi.")
+            queue.put_nowait("how are you")
+            await self._wait_for_history(llm, 4)
+
+            consumer.cancel()
+            await asyncio.gather(consumer, return_exceptions=True)
+            return llm
+
+        llm = asyncio.run(main())
+        self.assertEqual([m["content"] for m in llm.message_history],
+                         ["Hi.", "Reply to Hi.", "Hi. how are you", "Reply to Hi. how are you"])
+        self.assertEqual(llm._history_tokens, sum(llm._token_counts))
+        self.assertEqual(len(llm._token_counts), len(llm.message_history))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -14,12 +14,24 @@ to ensure natural-sounding speech output.
 """
 
 import asyncio
+import logging
 import numpy as np
 from cartesia import AsyncCartesia
+try:
+    from asyncio import timeout as async_timeout  # Python 3.11+
+except ImportError:  # Older Pythons: same API from the package aiohttp already pulls in
+    from async_timeout import timeout as async_timeout
 from components import TTSInterface
-from typing import AsyncGenerator
+from typing import AsyncGenerator, List
 import os
+import uuid
 from conversation_manager import ConversationManager, PipelineState
+
+logger = logging.getLogger(__name__)
+
+# Text whose last non-space character is one of these is a complete sentence
+_END_PUNCT = frozenset('.!?。！？')
+
 class CartesiaTTS(TTSInterface):
     """
     Cartesia-powered Text-to-Speech synthesis implementation.
@@ -39,7 +51,9 @@ class CartesiaTTS(TTSInterface):
     def __init__(self, 
                  sample_rate: int = 24000, 
                  voice_id: str = "a0e99841-438c-4a64-b679-ae501e7d6091",
-                 conversation_manager: ConversationManager = None
+                 conversation_manager: ConversationManager = None,
+                 coalesce_ms: int = 30,
+                 max_chars: int = 200
                  ):
         """
         Initialize the Cartesia TTS client.
@@ -47,6 +61,9 @@ class CartesiaTTS(TTSInterface):
         Args:
             sample_rate: Output audio sample rate in Hz (24kHz for high quality)
             voice_id: Cartesia voice ID for synthesis
+            coalesce_ms: After a sentence ends, wait this long for more complete
+                sentences to send in the same request (0 to send immediately)
+            max_chars: Stop coalescing once a request reaches this many characters
         """
         self.api_key = os.getenv("CARTESIA_API_KEY")
         if not self.api_key:
@@ -54,7 +71,18 @@ class CartesiaTTS(TTSInterface):
         
         self.sample_rate = sample_rate
         self.voice_id = voice_id
+        self.coalesce_ms = coalesce_ms
+        self.max_chars = max_chars
+        # Request parameters that are the same for every sentence, built once
+        self._voice = {"id": voice_id}
+        self._output_format = {
+            "container": "raw",       # Raw audio format
+            "encoding": "pcm_f32le",  # 32-bit float PCM little-endian
+            "sample_rate": sample_rate,  # 24kHz sample rate
+        }
         self.client = AsyncCartesia(api_key=self.api_key)
+        # WebSocket reused for every sentence, opened on first use
+        self._ws = None
 
         self.conversation_manager = conversation_manager
         self.current_session_id = 0
@@ -62,9 +90,10 @@ class CartesiaTTS(TTSInterface):
         """
         Convert streaming text to synthesized speech audio.
         
-        This method consumes text chunks from the LLM and accumulates them into
-        complete sentences before sending them for synthesis. This approach
-        ensures more natural-sounding speech output.
+        Text chunks from the LLM are accumulated into complete sentences by a
+        background task, so the next sentence keeps building while the current
+        one is being synthesized. This approach ensures more natural-sounding
+        speech output without stalling the LLM stream.
         
         Args:
             text_queue: Queue containing text chunks from LLM and END signal
@@ -72,68 +101,146 @@ class CartesiaTTS(TTSInterface):
         Yields:
             bytes: Audio chunks in PCM format for real-time playback
         """
-        buffer = ""
+        sentence_queue: asyncio.Queue = asyncio.Queue()
+        accumulator_task = asyncio.create_task(
+            self._accumulate_sentences(text_queue, sentence_queue))
+        
+        try:
+            while True:
+                try:
+                    # Next complete sentence, tagged with the session it belongs to
+                    session_id, sentence = await sentence_queue.get()
+                    # 🔥 丢弃旧session的句子
+                    if (self.conversation_manager and
+                        self.conversation_manager.get_current_session_id() != session_id):
+                        print(f"[TTS] Dropping stale sentence: '{sentence}'")
+                        continue
+                    self.current_session_id = session_id
+                    
+                    synthesis = self._synthesize_sentence(sentence)
+                    try:
+                        async for audio_chunk in synthesis:
+                            if (self.conversation_manager and 
+                                self.conversation_manager.get_current_session_id() != session_id):
+                                print(f"[TTS] Session expired, stopping synthesis...")
+                                break
+                            # 🔥 检查中断信号
+                            if self.conversation_manager and self.conversation_manager.interrupt_event.is_set():
+                                print("[TTS] Interrupted! Clearing buffer and stopping synthesis...")
+                                # 🔥 清空文本队列
+                                await self._clear_text_queue(text_queue)
+                                await self._clear_text_queue(sentence_queue)
+                                await self._clear_text_queue(audio_queue)
+                                
+                                break
+                            yield audio_chunk
+                    finally:
+                        # Close now rather than at garbage collection, so an
+                        # abandoned sentence is cancelled on the server right away
+                        await synthesis.aclose()
+            
+                except Exception as e:
+                    print(f"[TTS] Error in synthesis: {e}")
+                    continue
+                finally:
+                    # 🔥 报告清理完成
+                    if self.conversation_manager:
+                        self.conversation_manager.signal_cleanup_complete('tts')
+        finally:
+            accumulator_task.cancel()
+            await asyncio.gather(accumulator_task, return_exceptions=True)
+            # Only close the persistent WebSocket when the stream itself ends
+            await self._close_websocket()
+
+    async def _accumulate_sentences(self, text_queue: asyncio.Queue, sentence_queue: asyncio.Queue):
+        """
+        Accumulate LLM text chunks into sentences (runs as a background task).
+        
+        Each complete sentence is queued as (session_id, sentence). Sentences
+        completed within coalesce_ms of each other (up to max_chars) are queued
+        together, so short replies like "Hi. Sure." cost one synthesis request.
+        A partial sentence left over from an interrupted session is discarded
+        when text from the new session arrives.
+        
+        Args:
+            text_queue: Queue containing text chunks from LLM
+            sentence_queue: Queue receiving complete sentences for synthesis
+        """
+        loop = asyncio.get_running_loop()
+        # Stripped text fragments of the sentence being built, joined once when
+        # it is queued: rebuilding a string per token is quadratic in its length
+        buffer_parts: List[str] = []
+        buffer_chars = 0
+        buffer_session = 0
+        carry = None  # Chunk read while coalescing that belongs to a new session
         
         while True:
             try:
+                # Get next text chunk from LLM
+                if carry is not None:
+                    text, carry = carry, None
+                else:
+                    text = await text_queue.get()
                 # 🔥 记录当前session
                 session_id = self.conversation_manager.get_current_session_id() if self.conversation_manager else 0
-                self.current_session_id = session_id
+                if buffer_parts and session_id != buffer_session:
+                    # Leftover from an interrupted response
+                    buffer_parts.clear()
+                    buffer_chars = 0
+                buffer_session = session_id
                 
-                # Get next text chunk from LLM
-                text = await text_queue.get()
                 # Accumulate text into buffer
-                buffer += " " + text.strip() if buffer else text.strip()
-                print(f"[TTS] Accumulated text: '{buffer}'")
+                fragment = text.strip()
+                if not fragment:
+                    continue
+                buffer_parts.append(fragment)
+                buffer_chars += len(fragment) + 1
+                logger.debug("[TTS] Accumulated text: '%s'", fragment)
                 
-                # Check if we should synthesize the current buffer
-                if self._should_send(buffer):
-                    async for audio_chunk in self._synthesize_sentence(buffer):
-                        if (self.conversation_manager and 
-                            self.conversation_manager.get_current_session_id() != session_id):
-                            print(f"[TTS] Session expired, stopping synthesis...")
+                # A sentence ends when the newest fragment does. Fragments are
+                # already stripped, so checking the last character is enough
+                if fragment[-1] in _END_PUNCT:
+                    # Briefly wait for more sentences to batch into this request;
+                    # `boundary` counts the fragments up to the last complete one
+                    boundary = len(buffer_parts)
+                    deadline = loop.time() + self.coalesce_ms / 1000
+                    while buffer_chars < self.max_chars:
+                        remaining = deadline - loop.time()
+                        if remaining <= 0:
                             break
-                        # 🔥 检查中断信号
-                        if self.conversation_manager and self.conversation_manager.interrupt_event.is_set():
-                            print("[TTS] Interrupted! Clearing buffer and stopping synthesis...")
-                            # 🔥 清空文本队列
-                            await self._clear_text_queue(text_queue)
-                            await self._clear_text_queue(audio_queue)
-                            
+                        try:
+                            async with async_timeout(remaining):
+                                text = await text_queue.get()
+                        except asyncio.TimeoutError:
                             break
-                        yield audio_chunk
-                    buffer = ""  # Reset buffer after synthesis
+                        if (self.conversation_manager and
+                            self.conversation_manager.get_current_session_id() != session_id):
+                            carry = text  # Starts the next session's buffer
+                            break
+                        fragment = text.strip()
+                        if fragment:
+                            buffer_parts.append(fragment)
+                            buffer_chars += len(fragment) + 1
+                            if fragment[-1] in _END_PUNCT:
+                                boundary = len(buffer_parts)
+                    
+                    sentence_queue.put_nowait((session_id, " ".join(buffer_parts[:boundary])))
+                    # Keep the start of an unfinished sentence read while coalescing
+                    del buffer_parts[:boundary]
+                    buffer_chars = sum(len(part) + 1 for part in buffer_parts)
             
             except Exception as e:
                 print(f"[TTS] Error in text accumulation: {e}")
-                continue
-            finally:
-                # 🔥 报告清理完成
-                if self.conversation_manager:
-                    self.conversation_manager.signal_cleanup_complete('tts')
         
-    def _should_send(self, text: str) -> bool:
-        """
-        Determine if accumulated text should be sent for synthesis.
-        
-        This method checks for sentence-ending punctuation to decide when
-        to synthesize the accumulated text. This ensures natural speech
-        patterns and prevents synthesis of incomplete thoughts.
-        
-        Args:
-            text: The accumulated text buffer
-            
-        Returns:
-            bool: True if text should be synthesized now
-        """
-        return text.rstrip().endswith(('.', '!', '?', '。', '！', '？'))
-
     async def _synthesize_sentence(self, text: str) -> AsyncGenerator[bytes, None]:
         """
         Synthesize a complete sentence using Cartesia's TTS API.
         
         This method sends the text to Cartesia's Sonic model for synthesis
-        and yields the resulting audio chunks for real-time playback.
+        and yields the resulting audio chunks for real-time playback. If the
+        generator is closed before the audio is complete, the request's
+        context is cancelled so the server stops streaming it over the shared
+        WebSocket.
         
         Args:
             text: Complete sentence or phrase to synthesize
@@ -141,31 +248,87 @@ class CartesiaTTS(TTSInterface):
         Yields:
             bytes: Audio chunks in PCM float32 little-endian format
         """
-        try:
-            # Establish WebSocket connection to Cartesia TTS service
-            ws = await self.client.tts.websocket()
-            
-            # Send synthesis request and stream audio response
-            async for output in await ws.send(
-                model_id="sonic-2",           # Cartesia's Sonic model
-                transcript=text,              # Text to synthesize
-                voice={"id": self.voice_id},  # Selected voice
-                stream=True,                  # Enable streaming output
-                output_format={
-                    "container": "raw",       # Raw audio format
-                    "encoding": "pcm_f32le",  # 32-bit float PCM little-endian
-                    "sample_rate": self.sample_rate,  # 24kHz sample rate
-                },
-            ):
-                audio_bytes = output.audio  # Raw audio data
-                if audio_bytes:
-                    yield audio_bytes
+        for attempt in range(2):
+            yielded = False
+            try:
+                # Reuse the open WebSocket so only the first sentence pays the handshake
+                ws = await self._get_websocket()
+                
+                # One context per sentence, so an abandoned one can be cancelled
+                # without affecting the next sentence on the same socket
+                ctx = ws.context(str(uuid.uuid4()))
+                await ctx.send(
+                    model_id="sonic-2",           # Cartesia's Sonic model
+                    transcript=text,              # Text to synthesize
+                    voice=self._voice,            # Selected voice
+                    stream=True,                  # Enable streaming output
+                    output_format=self._output_format,
+                )
+                
+                # Stream audio response
+                receiver = ctx.receive()
+                completed = False
+                try:
+                    async for output in receiver:
+                        audio_bytes = output.audio  # Raw audio data
+                        if audio_bytes:
+                            yielded = True
+                            yield audio_bytes
+                    completed = True
+                finally:
+                    await receiver.aclose()
+                    if not completed:
+                        await self._cancel_context(ctx)
+                
+                print(f"[TTS] Synthesized: '{text}'")
+                return
             
-            await ws.close()
-            print(f"[TTS] Synthesized: '{text}'")
+            except Exception as e:
+                # The connection may have dropped while idle: reconnect and retry
+                # once, unless audio was already played (a retry would repeat it)
+                await self._close_websocket()
+                if attempt == 0 and not yielded:
+                    print(f"[TTS] WebSocket error, reconnecting: {e}")
+                    continue
+                print(f"[TTS] Error synthesizing '{text}': {e}")
+                return
+
+    async def _cancel_context(self, ctx):
+        """
+        Ask the server to stop generating audio for an abandoned context.
         
+        Args:
+            ctx: The Cartesia TTS context of the abandoned sentence
+        """
+        try:
+            await ctx.cancel()
         except Exception as e:
-            print(f"[TTS] Error synthesizing '{text}': {e}")
+            # Socket already gone - nothing left to stream for this context
+            print(f"[TTS] Error cancelling context {ctx.context_id}: {e}")
+        else:
+            print(f"[TTS] Cancelled context {ctx.context_id}")
+
+    async def _get_websocket(self):
+        """
+        Return the persistent TTS WebSocket, connecting it if needed.
+        
+        Returns:
+            AsyncTtsWebsocket: An open Cartesia TTS WebSocket
+        """
+        if self._ws is None:
+            self._ws = await self.client.tts.websocket()
+        else:
+            await self._ws.connect()  # No-op while the connection is open
+        return self._ws
+
+    async def _close_websocket(self):
+        """Close the persistent TTS WebSocket, if open."""
+        ws, self._ws = self._ws, None
+        if ws is not None:
+            try:
+                await ws.close()
+            except Exception as e:
+                print(f"[TTS] Error closing WebSocket: {e}")
     
     async def _clear_text_queue(self, text_queue: asyncio.Queue):
         """清空文本队列"""